@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from collections.abc import Callable
 from uuid import uuid4
 
 from modules.module.EMAModule import EMAModuleWrapper
@@ -33,7 +34,6 @@ class BaseModel(metaclass=ABCMeta):
     ema: EMAModuleWrapper
     ema_state_dict: dict | None
     train_progress: TrainProgress
-    model_spec: ModelSpec | None
     train_config: TrainConfig | None
 
     def __init__(
@@ -52,9 +52,27 @@ class BaseModel(metaclass=ABCMeta):
         self.param_group_mapping = None
         self.ema_state_dict = ema_state_dict
         self.train_progress = train_progress if train_progress is not None else TrainProgress()
-        self.model_spec = model_spec
+        self.__model_spec = model_spec
+        self.__model_spec_loader = None
         self.train_config = train_config
 
+    @property
+    def model_spec(self) -> ModelSpec | None:
+        if self.__model_spec_loader is not None:
+            self.__model_spec = self.__model_spec_loader()
+            self.__model_spec_loader = None
+        return self.__model_spec
+
+    @model_spec.setter
+    def model_spec(self, model_spec: ModelSpec | None):
+        self.__model_spec = model_spec
+        self.__model_spec_loader = None
+
+    def set_model_spec_loader(self, model_spec_loader: Callable[[], ModelSpec | None]):
+        # the model spec is only needed when saving, so it is loaded on first access
+        self.__model_spec = None
+        self.__model_spec_loader = model_spec_loader
+
     @abstractmethod
     def to(self, device: torch.device):
         pass
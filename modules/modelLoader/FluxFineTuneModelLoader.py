@@ -1,3 +1,5 @@
+from functools import partial
+
 from modules.model.FluxModel import FluxModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelLoader.flux.FluxEmbeddingLoader import FluxEmbeddingLoader
@@ -39,7 +41,7 @@ class FluxFineTuneModelLoader(
         model = FluxModel(model_type=model_type)
 
         self._load_internal_data(model, model_names.base_model)
-        model.model_spec = self._load_default_model_spec(model_type)
+        model.set_model_spec_loader(partial(self._load_default_model_spec, model_type))
 
         base_model_loader.load(model, model_type, model_names, weight_dtypes)
         embedding_loader.load_multiple(model, model_names)
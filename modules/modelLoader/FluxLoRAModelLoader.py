@@ -1,3 +1,5 @@
+from functools import partial
+
 from modules.model.FluxModel import FluxModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelLoader.flux.FluxEmbeddingLoader import FluxEmbeddingLoader
@@ -40,7 +42,7 @@ class FluxLoRAModelLoader(
 
         model = FluxModel(model_type=model_type)
         self._load_internal_data(model, model_names.lora)
-        model.model_spec = self._load_default_model_spec(model_type)
+        model.set_model_spec_loader(partial(self._load_default_model_spec, model_type))
 
         if model_names.base_model is not None:
             base_model_loader.load(model, model_type, model_names, weight_dtypes)
@@ -1,3 +1,5 @@
+from functools import partial
+
 from modules.model.PixArtAlphaModel import PixArtAlphaModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelLoader.mixin.InternalModelLoaderMixin import InternalModelLoaderMixin
@@ -41,7 +43,7 @@ class PixArtAlphaFineTuneModelLoader(
         model = PixArtAlphaModel(model_type=model_type)
 
         self._load_internal_data(model, model_names.base_model)
-        model.model_spec = self._load_default_model_spec(model_type)
+        model.set_model_spec_loader(partial(self._load_default_model_spec, model_type))
 
         base_model_loader.load(model, model_type, model_names, weight_dtypes)
         embedding_loader.load_multiple(model, model_names)
@@ -1,3 +1,5 @@
+from functools import partial
+
 from modules.model.StableDiffusionModel import StableDiffusionModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelLoader.mixin.InternalModelLoaderMixin import InternalModelLoaderMixin
@@ -58,6 +60,6 @@ class StableDiffusionEmbeddingModelLoader(
         embedding_loader.load_single(model, model_names)
         self._load_internal_data(model, model_names.embedding.model_name)
 
-        model.model_spec = self._load_default_model_spec(model_type)
+        model.set_model_spec_loader(partial(self._load_default_model_spec, model_type))
 
         return model
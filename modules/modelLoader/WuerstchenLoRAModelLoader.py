@@ -1,3 +1,5 @@
+from functools import partial
+
 from modules.model.WuerstchenModel import WuerstchenModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelLoader.mixin.InternalModelLoaderMixin import InternalModelLoaderMixin
@@ -42,7 +44,7 @@ class WuerstchenLoRAModelLoader(
 
         model = WuerstchenModel(model_type=model_type)
         self._load_internal_data(model, model_names.lora)
-        model.model_spec = self._load_default_model_spec(model_type)
+        model.set_model_spec_loader(partial(self._load_default_model_spec, model_type))
 
         if model_names.base_model is not None:
             base_model_loader.load(model, model_type, model_names, weight_dtypes)
@@ -1,7 +1,7 @@
-import json
 import os
 from abc import ABCMeta
 
+from modules.util import json_util
 from modules.util.enum.DataType import DataType
 from modules.util.quantization_util import replace_linear_with_int8_layers, replace_linear_with_nf4_layers
 
@@ -53,8 +53,8 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
         is_sharded = full_shard_index_filename is not None
 
         if is_sharded:
-            with open(full_shard_index_filename, "r") as f:
-                index_file = json.loads(f.read())
+            with open(full_shard_index_filename, "rb") as f:
+                index_file = json_util.loads(f.read())
                 filenames = sorted(set(index_file["weight_map"].values()))
         else:
             filenames = [model_filename]
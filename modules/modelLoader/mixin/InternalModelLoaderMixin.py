@@ -1,14 +1,30 @@
-import json
 import os
 from abc import ABCMeta
 
 from modules.model.BaseModel import BaseModel
+from modules.util import json_util, safetensors_util
+from modules.util.torch_util import safe_torch_load
 from modules.util.TrainProgress import TrainProgress
 
-import torch
+from safetensors import safe_open
 
 
 class InternalModelLoaderMixin(metaclass=ABCMeta):
+    def __load_ema_safetensors(
+            self,
+            file_name: str,
+    ) -> dict:
+        with safe_open(file_name, framework="pt") as f:
+            metadata = f.metadata() or {}
+
+        return {
+            "decay": float(metadata["decay"]),
+            # a generator, each parameter is only read when the ema module moves it to its device
+            "ema_parameters": safetensors_util.iter_tensors(
+                file_name, (f"ema_parameters.{i}" for i in range(int(metadata["parameter_count"])))
+            ),
+        }
+
     def _load_internal_data(
             self,
             model: BaseModel,
@@ -16,8 +32,8 @@ class InternalModelLoaderMixin(metaclass=ABCMeta):
     ):
         if os.path.exists(os.path.join(model_name, "meta.json")):
             # train progress
-            with open(os.path.join(model_name, "meta.json"), "r") as meta_file:
-                meta = json.load(meta_file)
+            with open(os.path.join(model_name, "meta.json"), "rb") as meta_file:
+                meta = json_util.loads(meta_file.read())
                 train_progress = TrainProgress(
                     epoch=meta['train_progress']['epoch'],
                     epoch_step=meta['train_progress']['epoch_step'],
@@ -27,15 +43,18 @@ class InternalModelLoaderMixin(metaclass=ABCMeta):
 
             # optimizer
             try:
-                model.optimizer_state_dict = torch.load(os.path.join(model_name, "optimizer", "optimizer.pt"))
+                model.optimizer_state_dict = safe_torch_load(os.path.join(model_name, "optimizer", "optimizer.pt"))
             except FileNotFoundError:
                 pass
 
             # ema
-            try:
-                model.ema_state_dict = torch.load(os.path.join(model_name, "ema", "ema.pt"))
-            except FileNotFoundError:
-                pass
+            if os.path.isfile(os.path.join(model_name, "ema", "ema.safetensors")):
+                model.ema_state_dict = self.__load_ema_safetensors(os.path.join(model_name, "ema", "ema.safetensors"))
+            else:
+                try:
+                    model.ema_state_dict = safe_torch_load(os.path.join(model_name, "ema", "ema.pt"))
+                except FileNotFoundError:
+                    pass
 
             # meta
             model.train_progress = train_progress
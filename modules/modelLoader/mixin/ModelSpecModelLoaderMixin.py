@@ -1,10 +1,10 @@
-import json
 from abc import ABCMeta
 
+from modules.util import json_util
 from modules.util.enum.ModelType import ModelType
 from modules.util.modelSpec.ModelSpec import ModelSpec
 
-from safetensors import safe_open
+from safetensors import SafetensorError, safe_open
 
 
 class ModelSpecModelLoaderMixin(metaclass=ABCMeta):
@@ -23,17 +23,18 @@ class ModelSpecModelLoaderMixin(metaclass=ABCMeta):
 
         model_spec_name = self._default_model_spec_name(model_type)
         if model_spec_name:
-            with open(model_spec_name, "r", encoding="utf-8") as model_spec_file:
-                model_spec = ModelSpec.from_dict(json.load(model_spec_file))
+            with open(model_spec_name, "rb") as model_spec_file:
+                model_spec = ModelSpec.from_dict(json_util.loads(model_spec_file.read()))
         else:
             model_spec = ModelSpec()
 
         if safetensors_file_name:
             try:
                 with safe_open(safetensors_file_name, framework="pt") as f:
-                    if "modelspec.sai_model_spec" in f.metadata():
-                        model_spec = ModelSpec.from_dict(f.metadata())
-            except:
+                    metadata = f.metadata() or {}
+                if "modelspec.sai_model_spec" in metadata:
+                    model_spec = ModelSpec.from_dict(metadata)
+            except (OSError, SafetensorError):
                 pass
 
         return model_spec
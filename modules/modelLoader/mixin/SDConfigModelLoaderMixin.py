@@ -1,3 +1,5 @@
+import copy
+import functools
 import os
 from abc import ABCMeta
 
@@ -5,6 +7,18 @@ from modules.util.enum.ModelType import ModelType
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as _YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlSafeLoader
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_sd_config(yaml_name: str, mtime: float) -> dict:
+    # mtime is part of the cache key, so edited config files are parsed again
+    with open(yaml_name, "r") as f:
+        return yaml.load(f, Loader=_YamlSafeLoader)
+
 
 class SDConfigModelLoaderMixin(metaclass=ABCMeta):
 
@@ -44,9 +58,14 @@ class SDConfigModelLoaderMixin(metaclass=ABCMeta):
             base_model_name: str | None = None,
     ) -> dict | None:
         yaml_name = self._get_sd_config_name(model_type, base_model_name)
+        return self._load_sd_config_file(yaml_name)
 
+    def _load_sd_config_file(
+            self,
+            yaml_name: str | None,
+    ) -> dict | None:
         if yaml_name:
-            with open(yaml_name, "r") as f:
-                return yaml.safe_load(f)
+            # deep copy, callers are allowed to modify the returned config
+            return copy.deepcopy(_cached_sd_config(yaml_name, os.path.getmtime(yaml_name)))
         else:
             return None
@@ -1,20 +1,36 @@
+import hashlib
 import os
+import shutil
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.model.StableDiffusionModel import StableDiffusionModel
 from modules.modelLoader.mixin.SDConfigModelLoaderMixin import SDConfigModelLoaderMixin
-from modules.util import create
+from modules.util import create, safetensors_util
+from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
 from modules.util.enum.NoiseScheduler import NoiseScheduler
 from modules.util.ModelNames import ModelNames
 from modules.util.ModelWeightDtypes import ModelWeightDtypes
+from modules.util.quantization_util import (
+    replace_linear_with_fp8_layers,
+    replace_linear_with_int8_block_wise_layers,
+    replace_linear_with_nf4_layers,
+)
+from modules.util.torch_util import safe_torch_load
 
 import torch
+from torch import nn
 
-from diffusers import AutoencoderKL, DDIMScheduler, UNet2DConditionModel
+from diffusers import AutoencoderKL, DDIMScheduler, DiffusionPipeline, UNet2DConditionModel
 from diffusers.pipelines.stable_diffusion.convert_from_ckpt import download_from_original_stable_diffusion_ckpt
 from transformers import CLIPTextModel, CLIPTokenizer, DPTForDepthEstimation, DPTImageProcessor
 
+from safetensors.torch import load_file
+
+# directory to cache converted single file checkpoints in, caching is disabled if it is not set
+CONVERSION_CACHE_DIR_ENV = "ONETRAINER_CKPT_CONVERT_CACHE"
+
 
 class StableDiffusionModelLoader(
     SDConfigModelLoaderMixin,
@@ -46,6 +62,53 @@ class StableDiffusionModelLoader(
             case _:
                 return None
 
+    def __unquantized_dtype(
+            self,
+            dtype: DataType,
+            weight_dtypes: ModelWeightDtypes,
+    ) -> torch.dtype | None:
+        # the parts of a module that are not replaced by quantized linear layers are kept in the train dtype
+        if (dtype.quantize_fp8() or dtype.quantize_int8_block_wise() or dtype.quantize_nf4()) \
+                and weight_dtypes.train_dtype is not None:
+            return weight_dtypes.train_dtype.torch_dtype()
+        return dtype.torch_dtype(supports_quantization=False)
+
+    def __load_dtype(
+            self,
+            dtype: DataType,
+            weight_dtypes: ModelWeightDtypes,
+    ) -> torch.dtype | None:
+        # quantized linear layers are created after loading
+        if dtype.quantize_fp8() or dtype.quantize_int8_block_wise() or dtype.quantize_nf4():
+            return self.__unquantized_dtype(dtype, weight_dtypes)
+        return dtype.torch_dtype()
+
+    def __quantize_linear_layers(
+            self,
+            module: nn.Module,
+            dtype: DataType,
+            keep_in_fp32_modules: list[str] | None = None,
+    ):
+        if dtype.quantize_fp8():
+            replace_linear_with_fp8_layers(module, keep_in_fp32_modules)
+        elif dtype.quantize_int8_block_wise():
+            replace_linear_with_int8_block_wise_layers(module, keep_in_fp32_modules)
+        elif dtype.quantize_nf4():
+            # the bitsandbytes nf4 kernels need a cuda device
+            if torch.cuda.is_available():
+                replace_linear_with_nf4_layers(module, keep_in_fp32_modules)
+            else:
+                print("nfloat4 weights need a cuda device, continuing with unquantized linear layers")
+
+    def __quantize(
+            self,
+            text_encoder: CLIPTextModel,
+            unet: UNet2DConditionModel,
+            weight_dtypes: ModelWeightDtypes,
+    ):
+        self.__quantize_linear_layers(text_encoder, weight_dtypes.text_encoder)
+        self.__quantize_linear_layers(unet, weight_dtypes.unet, ["time_embedding", "add_embedding"])
+
     def __load_internal(
             self,
             model: StableDiffusionModel,
@@ -67,55 +130,72 @@ class StableDiffusionModelLoader(
             base_model_name: str,
             vae_model_name: str,
     ):
-        tokenizer = CLIPTokenizer.from_pretrained(
-            base_model_name,
-            subfolder="tokenizer",
-        )
+        # only the loads that don't build any modules run in the background. Building a module patches process
+        # global state (init_empty_weights, the default dtype), so the models are loaded one after the other.
+        # leaving the with block waits for the background loads, even if a model fails to load
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="model_loader") as executor:
+            tokenizer_future = executor.submit(
+                CLIPTokenizer.from_pretrained,
+                base_model_name,
+                subfolder="tokenizer",
+            )
 
-        noise_scheduler = DDIMScheduler.from_pretrained(
-            base_model_name,
-            subfolder="scheduler",
-        )
-        noise_scheduler = create.create_noise_scheduler(
-            noise_scheduler=NoiseScheduler.DDIM,
-            original_noise_scheduler=noise_scheduler,
-        )
+            noise_scheduler_future = executor.submit(
+                DDIMScheduler.from_pretrained,
+                base_model_name,
+                subfolder="scheduler",
+            )
 
-        text_encoder = CLIPTextModel.from_pretrained(
-            base_model_name,
-            subfolder="text_encoder",
-            torch_dtype=weight_dtypes.text_encoder.torch_dtype(),
-        )
-        text_encoder.text_model.embeddings.to(dtype=weight_dtypes.text_encoder.torch_dtype(supports_quantization=False))
+            image_depth_processor_future = executor.submit(
+                DPTImageProcessor.from_pretrained,
+                base_model_name,
+                subfolder="feature_extractor",
+            ) if model_type.has_depth_input() else None
 
-        if vae_model_name:
-            vae = AutoencoderKL.from_pretrained(
-                vae_model_name,
-                torch_dtype=weight_dtypes.vae.torch_dtype(),
+            text_encoder = CLIPTextModel.from_pretrained(
+                base_model_name,
+                subfolder="text_encoder",
+                torch_dtype=self.__load_dtype(weight_dtypes.text_encoder, weight_dtypes),
             )
-        else:
-            vae = AutoencoderKL.from_pretrained(
+            text_encoder.text_model.embeddings.to(
+                dtype=self.__unquantized_dtype(weight_dtypes.text_encoder, weight_dtypes)
+            )
+
+            if vae_model_name:
+                vae = AutoencoderKL.from_pretrained(
+                    vae_model_name,
+                    torch_dtype=weight_dtypes.vae.torch_dtype(),
+                )
+            else:
+                vae = AutoencoderKL.from_pretrained(
+                    base_model_name,
+                    subfolder="vae",
+                    torch_dtype=weight_dtypes.vae.torch_dtype(),
+                )
+
+            unet = UNet2DConditionModel.from_pretrained(
                 base_model_name,
-                subfolder="vae",
-                torch_dtype=weight_dtypes.vae.torch_dtype(),
+                subfolder="unet",
+                torch_dtype=self.__load_dtype(weight_dtypes.unet, weight_dtypes),
             )
 
-        unet = UNet2DConditionModel.from_pretrained(
-            base_model_name,
-            subfolder="unet",
-            torch_dtype=weight_dtypes.unet.torch_dtype(),
-        )
+            depth_estimator = DPTForDepthEstimation.from_pretrained(
+                base_model_name,
+                subfolder="depth_estimator",
+                torch_dtype=weight_dtypes.unet.torch_dtype(),  # TODO: use depth estimator dtype
+            ) if model_type.has_depth_input() else None
 
-        image_depth_processor = DPTImageProcessor.from_pretrained(
-            base_model_name,
-            subfolder="feature_extractor",
-        ) if model_type.has_depth_input() else None
+        self.__quantize(text_encoder, unet, weight_dtypes)
 
-        depth_estimator = DPTForDepthEstimation.from_pretrained(
-            base_model_name,
-            subfolder="depth_estimator",
-            torch_dtype=weight_dtypes.unet.torch_dtype(),  # TODO: use depth estimator dtype
-        ) if model_type.has_depth_input() else None
+        tokenizer = tokenizer_future.result()
+
+        noise_scheduler = create.create_noise_scheduler(
+            noise_scheduler=NoiseScheduler.DDIM,
+            original_noise_scheduler=noise_scheduler_future.result(),
+        )
+
+        image_depth_processor = image_depth_processor_future.result() \
+            if image_depth_processor_future is not None else None
 
         model.model_type = model_type
         model.tokenizer = tokenizer
@@ -142,17 +222,99 @@ class StableDiffusionModelLoader(
 
         return converted_state_dict
 
-    def __load_ckpt(
+    def __converted_model_dir(
+            self,
+            base_model_name: str,
+    ) -> str | None:
+        # a diffusers model next to the checkpoint, for example "model.diffusers" for "model.safetensors"
+        stem, _ = os.path.splitext(base_model_name)
+        converted_model_dir = stem + ".diffusers"
+        if os.path.isfile(os.path.join(converted_model_dir, "model_index.json")):
+            return converted_model_dir
+        return None
+
+    def __conversion_cache_dir(
+            self,
+            model: StableDiffusionModel,
+            model_type: ModelType,
+            base_model_name: str,
+    ) -> str | None:
+        # the cache needs several GB per converted model, it is only used if a cache directory is set
+        cache_root = os.environ.get(CONVERSION_CACHE_DIR_ENV)
+        if not cache_root:
+            return None
+
+        # the conversion doesn't include depth models, they can't be loaded from a diffusers snapshot
+        if model_type.has_depth_input() or not os.path.isfile(base_model_name):
+            return None
+
+        # hashing the whole file would take longer than the conversion, only the first 64KB are used
+        file_hash = hashlib.sha256()
+        with open(base_model_name, "rb") as f:
+            file_hash.update(f.read(64 * 1024))
+        stat = os.stat(base_model_name)
+        file_hash.update(f"{stat.st_size}-{stat.st_mtime_ns}-{model_type}".encode())
+        if model.sd_config_filename:
+            file_hash.update(f"{model.sd_config_filename}-{os.stat(model.sd_config_filename).st_mtime_ns}".encode())
+
+        return os.path.join(os.path.expanduser(cache_root), file_hash.hexdigest())
+
+    def __save_conversion_cache(
+            self,
+            pipeline: DiffusionPipeline,
+            cache_dir: str,
+    ):
+        # save to a temporary directory first, an interrupted save should not leave a broken snapshot behind
+        temp_dir = cache_dir + ".tmp"
+        try:
+            pipeline.save_pretrained(temp_dir, safe_serialization=True)
+            os.replace(temp_dir, cache_dir)
+        except Exception:
+            # the conversion itself succeeded, a failed save should not fail the load
+            print(f"could not save the converted model to {cache_dir}, continuing without caching it")
+            traceback.print_exc()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def __find_converted_model(
+            self,
+            model: StableDiffusionModel,
+            model_type: ModelType,
+            base_model_name: str,
+    ) -> str | None:
+        converted_model_dir = self.__converted_model_dir(base_model_name)
+        if converted_model_dir is not None:
+            return converted_model_dir
+
+        conversion_cache_dir = self.__conversion_cache_dir(model, model_type, base_model_name)
+        if conversion_cache_dir is not None and os.path.isdir(conversion_cache_dir):
+            return conversion_cache_dir
+
+        return None
+
+    def __load_converted(
             self,
             model: StableDiffusionModel,
             model_type: ModelType,
             weight_dtypes: ModelWeightDtypes,
             base_model_name: str,
             vae_model_name: str,
-    ):
-        state_dict = torch.load(base_model_name)
-        state_dict = self.__fix_nai_model(state_dict)
+    ) -> bool:
+        # loads an already converted version of a single file checkpoint, returns False if there is none
+        converted_model_dir = self.__find_converted_model(model, model_type, base_model_name)
+        if converted_model_dir is None:
+            return False
 
+        self.__load_diffusers(model, model_type, weight_dtypes, converted_model_dir, vae_model_name)
+        return True
+
+    def __convert(
+            self,
+            model: StableDiffusionModel,
+            model_type: ModelType,
+            base_model_name: str,
+            state_dict: dict,
+    ) -> DiffusionPipeline:
         num_in_channels = 4
         if model_type.has_mask_input():
             num_in_channels += 1
@@ -166,6 +328,29 @@ class StableDiffusionModelLoader(
             load_safety_checker=False,
         )
 
+        conversion_cache_dir = self.__conversion_cache_dir(model, model_type, base_model_name)
+        if conversion_cache_dir is not None:
+            self.__save_conversion_cache(pipeline, conversion_cache_dir)
+
+        return pipeline
+
+    def __load_ckpt(
+            self,
+            model: StableDiffusionModel,
+            model_type: ModelType,
+            weight_dtypes: ModelWeightDtypes,
+            base_model_name: str,
+            vae_model_name: str,
+    ):
+        if self.__load_converted(model, model_type, weight_dtypes, base_model_name, vae_model_name):
+            return
+
+        # memory mapped, the tensors are read directly from the page cache during the conversion
+        state_dict = safe_torch_load(base_model_name)
+        state_dict = self.__fix_nai_model(state_dict)
+
+        pipeline = self.__convert(model, model_type, base_model_name, state_dict)
+
         noise_scheduler = create.create_noise_scheduler(
             noise_scheduler=NoiseScheduler.DDIM,
             original_noise_scheduler=pipeline.scheduler,
@@ -177,10 +362,12 @@ class StableDiffusionModelLoader(
                 torch_dtype=weight_dtypes.vae.torch_dtype(),
             )
 
-        text_encoder = pipeline.text_encoder.to(dtype=weight_dtypes.text_encoder.torch_dtype())
-        text_encoder.text_model.embeddings.to(dtype=weight_dtypes.text_encoder.torch_dtype(False))
+        text_encoder = pipeline.text_encoder.to(dtype=self.__load_dtype(weight_dtypes.text_encoder, weight_dtypes))
+        text_encoder.text_model.embeddings.to(dtype=self.__unquantized_dtype(weight_dtypes.text_encoder, weight_dtypes))
         vae = pipeline.vae.to(dtype=weight_dtypes.vae.torch_dtype())
-        unet = pipeline.unet.to(dtype=weight_dtypes.unet.torch_dtype())
+        unet = pipeline.unet.to(dtype=self.__load_dtype(weight_dtypes.unet, weight_dtypes))
+
+        self.__quantize(text_encoder, unet, weight_dtypes)
 
         model.model_type = model_type
         model.tokenizer = pipeline.tokenizer
@@ -199,19 +386,14 @@ class StableDiffusionModelLoader(
             base_model_name: str,
             vae_model_name: str,
     ):
-        num_in_channels = 4
-        if model_type.has_mask_input():
-            num_in_channels += 1
-        if model_type.has_conditioning_image_input():
-            num_in_channels += 4
+        if self.__load_converted(model, model_type, weight_dtypes, base_model_name, vae_model_name):
+            return
 
-        pipeline = download_from_original_stable_diffusion_ckpt(
-            checkpoint_path_or_dict=base_model_name,
-            original_config_file=model.sd_config_filename,
-            num_in_channels=num_in_channels,
-            load_safety_checker=False,
-            from_safetensors=True,
-        )
+        # load the state dict here instead of letting diffusers reopen the file, the conversion only accepts
+        # tensors on the cpu, so there is no benefit in loading them to the gpu first
+        state_dict = load_file(base_model_name, device="cpu")
+
+        pipeline = self.__convert(model, model_type, base_model_name, state_dict)
 
         noise_scheduler = create.create_noise_scheduler(
             noise_scheduler=NoiseScheduler.DDIM,
@@ -224,10 +406,12 @@ class StableDiffusionModelLoader(
                 torch_dtype=weight_dtypes.vae.torch_dtype(),
             )
 
-        text_encoder = pipeline.text_encoder.to(dtype=weight_dtypes.text_encoder.torch_dtype())
-        text_encoder.text_model.embeddings.to(dtype=weight_dtypes.text_encoder.torch_dtype(False))
+        text_encoder = pipeline.text_encoder.to(dtype=self.__load_dtype(weight_dtypes.text_encoder, weight_dtypes))
+        text_encoder.text_model.embeddings.to(dtype=self.__unquantized_dtype(weight_dtypes.text_encoder, weight_dtypes))
         vae = pipeline.vae.to(dtype=weight_dtypes.vae.torch_dtype())
-        unet = pipeline.unet.to(dtype=weight_dtypes.unet.torch_dtype())
+        unet = pipeline.unet.to(dtype=self.__load_dtype(weight_dtypes.unet, weight_dtypes))
+
+        self.__quantize(text_encoder, unet, weight_dtypes)
 
         model.model_type = model_type
         model.tokenizer = pipeline.tokenizer
@@ -245,35 +429,40 @@ class StableDiffusionModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ):
-        stacktraces = []
+        exceptions = []
+
+        # try the loader matching the detected format first, and only fall back to the others on failure
+        base_model_name = model_names.base_model
+        if os.path.isdir(base_model_name):
+            loaders = [self.__load_internal, self.__load_diffusers, self.__load_safetensors, self.__load_ckpt]
+        elif base_model_name.endswith(".safetensors"):
+            loaders = [self.__load_safetensors, self.__load_ckpt, self.__load_internal, self.__load_diffusers]
+        elif os.path.isfile(base_model_name):
+            loaders = [self.__load_ckpt, self.__load_safetensors, self.__load_internal, self.__load_diffusers]
+        else:
+            # not a local path, most likely a huggingface repository
+            loaders = [self.__load_diffusers, self.__load_internal, self.__load_safetensors, self.__load_ckpt]
 
-        model.sd_config = self._load_sd_config(model_type, model_names.base_model)
         model.sd_config_filename = self._get_sd_config_name(model_type, model_names.base_model)
 
-        try:
-            self.__load_internal(model, model_type, weight_dtypes, model_names.base_model, model_names.vae_model)
-            return
-        except:
-            stacktraces.append(traceback.format_exc())
-
-        try:
-            self.__load_diffusers(model, model_type, weight_dtypes, model_names.base_model, model_names.vae_model)
-            return
-        except:
-            stacktraces.append(traceback.format_exc())
-
-        try:
-            self.__load_safetensors(model, model_type, weight_dtypes, model_names.base_model, model_names.vae_model)
-            return
-        except:
-            stacktraces.append(traceback.format_exc())
-
-        try:
-            self.__load_ckpt(model, model_type, weight_dtypes, model_names.base_model, model_names.vae_model)
-            return
-        except:
-            stacktraces.append(traceback.format_exc())
-
-        for stacktrace in stacktraces:
-            print(stacktrace)
+        # start reading a single file checkpoint in the background while the config is loaded. this is skipped if an
+        # already converted model will be loaded instead
+        if os.path.isfile(base_model_name) \
+                and self.__find_converted_model(model, model_type, base_model_name) is None:
+            safetensors_util.prefetch_file(base_model_name)
+
+        model.sd_config = self._load_sd_config_file(model.sd_config_filename)
+
+        for loader in loaders:
+            try:
+                loader(model, model_type, weight_dtypes, model_names.base_model, model_names.vae_model)
+                return
+            except Exception as e:
+                # the stacktraces are only formatted if all loaders fail. clearing the frames releases
+                # references to partially loaded weights until then
+                traceback.clear_frames(e.__traceback__)
+                exceptions.append(e)
+
+        for exception in exceptions:
+            traceback.print_exception(exception)
         raise Exception("could not load model: " + model_names.base_model)
@@ -6,6 +6,8 @@ from modules.model.BaseModel import BaseModel
 
 import torch
 
+from safetensors.torch import save_file
+
 
 class InternalModelSaverMixin(metaclass=ABCMeta):
 
@@ -26,7 +28,15 @@ class InternalModelSaverMixin(metaclass=ABCMeta):
         # ema
         if model.ema:
             os.makedirs(os.path.join(destination, "ema"), exist_ok=True)
-            torch.save(model.ema.state_dict(), os.path.join(destination, "ema", "ema.pt"))
+            ema_state_dict = model.ema.state_dict()
+            save_file(
+                {f"ema_parameters.{i}": p.contiguous() for i, p in enumerate(ema_state_dict["ema_parameters"])},
+                os.path.join(destination, "ema", "ema.safetensors"),
+                metadata={
+                    "decay": str(ema_state_dict["decay"]),
+                    "parameter_count": str(len(ema_state_dict["ema_parameters"])),
+                },
+            )
 
         # meta
         with open(os.path.join(destination, "meta.json"), "w") as meta_file:
@@ -19,6 +19,7 @@ from modules.util.conv_util import apply_circular_padding_to_conv2d
 from modules.util.dtype_util import create_autocast_context
 from modules.util.enum.AttentionMechanism import AttentionMechanism
 from modules.util.enum.TrainingMethod import TrainingMethod
+from modules.util.quantization_util import set_nf4_compute_type
 from modules.util.TrainProgress import TrainProgress
 
 import torch
@@ -92,6 +93,9 @@ class BaseStableDiffusionSetup(
             config.weight_dtypes().embedding if config.train_any_embedding() else None,
         ], config.enable_autocast_cache)
 
+        set_nf4_compute_type(model.text_encoder, model.train_dtype)
+        set_nf4_compute_type(model.unet, model.train_dtype)
+
     def _setup_additional_embeddings(
             self,
             model: StableDiffusionModel,
@@ -0,0 +1,92 @@
+import torch
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+
+class LinearFp8(nn.Linear):
+    """
+    Linear layer that stores its weight as float8 (e4m3) with one scale per output channel.
+    The weight is dequantized to the input dtype during the forward pass.
+    """
+
+    weight_scale: Tensor
+
+    def __init__(
+            self,
+            in_features: int,
+            out_features: int,
+            bias: bool = True,
+            device: torch.device | None = None,
+            dtype: torch.dtype | None = None,
+    ):
+        super(LinearFp8, self).__init__(in_features, out_features, bias, device, dtype)
+
+        # the scale is not persistent, state dicts contain the dequantized weight instead
+        self.register_buffer(
+            "weight_scale",
+            torch.ones((out_features, 1), device=device, dtype=dtype),
+            persistent=False,
+        )
+
+    @staticmethod
+    def from_linear(module: nn.Linear) -> 'LinearFp8':
+        # created on the meta device to skip the weight initialization, quantize() replaces all tensors
+        quant_linear = LinearFp8(
+            in_features=module.in_features,
+            out_features=module.out_features,
+            bias=module.bias is not None,
+            device=torch.device("meta"),
+            dtype=module.weight.dtype,
+        )
+        quant_linear.quantize(module.weight, module.bias)
+
+        return quant_linear
+
+    @torch.no_grad()
+    def quantize(self, weight: Tensor, bias: Tensor | None = None):
+        fp8_max = torch.finfo(torch.float8_e4m3fn).max
+
+        float_weight = weight.detach().float()
+        scale = float_weight.abs().amax(dim=-1, keepdim=True).clamp(min=1e-12) / fp8_max
+
+        self.weight_scale = scale.to(dtype=weight.dtype)
+        self.weight = nn.Parameter(
+            (float_weight / scale).clamp(-fp8_max, fp8_max).to(dtype=torch.float8_e4m3fn),
+            requires_grad=False,
+        )
+        if bias is not None:
+            self.bias = nn.Parameter(bias.detach().clone(), requires_grad=False)
+
+    def unquantized_weight(self, dtype: torch.dtype) -> Tensor:
+        # multiplying by the scale is also correct if the weight was cast to a different dtype
+        return self.weight.detach().to(dtype=dtype) * self.weight_scale.to(dtype=dtype)
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        super(LinearFp8, self)._save_to_state_dict(destination, prefix, keep_vars)
+        destination[prefix + "weight"] = self.unquantized_weight(self.weight_scale.dtype)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        # state dicts contain the dequantized weight, it is quantized again instead of being copied into the weight
+        weight_key = prefix + "weight"
+        bias_key = prefix + "bias"
+        if weight_key in state_dict:
+            bias = state_dict.get(bias_key)
+            self.quantize(
+                state_dict[weight_key].to(device=self.weight.device, dtype=self.weight_scale.dtype),
+                bias.to(device=self.weight.device) if bias is not None else None,
+            )
+
+            state_dict = {key: value for key, value in state_dict.items() if key.startswith(prefix)}
+            state_dict[weight_key] = self.weight
+            if self.bias is not None and bias is not None:
+                state_dict[bias_key] = self.bias
+
+        super(LinearFp8, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs
+        )
+
+    def forward(self, x: Tensor) -> Tensor:
+        weight = self.weight.to(dtype=x.dtype) * self.weight_scale.to(dtype=x.dtype)
+        bias = self.bias.to(dtype=x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
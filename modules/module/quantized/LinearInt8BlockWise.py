@@ -0,0 +1,115 @@
+import math
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+
+class LinearInt8BlockWise(nn.Linear):
+    """
+    Linear layer that stores its weight as int8 with one symmetric scale per block_size x block_size block.
+    The weight is dequantized to the input dtype during the forward pass. The stored weight is padded to a multiple
+    of the block size, use get_weight_shape() to get the shape of the unquantized weight.
+    """
+
+    weight_scale: Tensor
+
+    def __init__(
+            self,
+            in_features: int,
+            out_features: int,
+            bias: bool = True,
+            device: torch.device | None = None,
+            dtype: torch.dtype | None = None,
+            block_size: int = 128,
+    ):
+        super(LinearInt8BlockWise, self).__init__(in_features, out_features, bias, device, dtype)
+        self.block_size = block_size
+
+        # the scale is not persistent, state dicts contain the dequantized weight instead
+        self.register_buffer(
+            "weight_scale",
+            torch.ones(
+                (math.ceil(out_features / block_size), math.ceil(in_features / block_size)),
+                device=device,
+                dtype=dtype,
+            ),
+            persistent=False,
+        )
+
+    @staticmethod
+    def from_linear(module: nn.Linear, block_size: int = 128) -> 'LinearInt8BlockWise':
+        # created on the meta device to skip the weight initialization, quantize() replaces all tensors
+        quant_linear = LinearInt8BlockWise(
+            in_features=module.in_features,
+            out_features=module.out_features,
+            bias=module.bias is not None,
+            device=torch.device("meta"),
+            dtype=module.weight.dtype,
+            block_size=block_size,
+        )
+        quant_linear.quantize(module.weight, module.bias)
+
+        return quant_linear
+
+    @torch.no_grad()
+    def quantize(self, weight: Tensor, bias: Tensor | None = None):
+        out_features, in_features = weight.shape
+        block_size = self.block_size
+        out_blocks = math.ceil(out_features / block_size)
+        in_blocks = math.ceil(in_features / block_size)
+
+        # pad to a multiple of the block size, so the weight can be viewed as a grid of blocks
+        padded_weight = F.pad(
+            weight.detach().float(),
+            (0, in_blocks * block_size - in_features, 0, out_blocks * block_size - out_features),
+        )
+        blocks = padded_weight.view(out_blocks, block_size, in_blocks, block_size)
+        scale = blocks.abs().amax(dim=(1, 3)).clamp(min=1e-12) / 127
+
+        quantized_blocks = (blocks / scale[:, None, :, None]).round().clamp(-127, 127).to(dtype=torch.int8)
+        quantized_weight = quantized_blocks.view(out_blocks * block_size, in_blocks * block_size)
+
+        self.weight_scale = scale.to(dtype=weight.dtype)
+        # the weight is kept padded, so it can be dequantized block wise without expanding the scale
+        self.weight = nn.Parameter(quantized_weight, requires_grad=False)
+        if bias is not None:
+            self.bias = nn.Parameter(bias.detach().clone(), requires_grad=False)
+
+    def unquantized_weight(self, dtype: torch.dtype) -> Tensor:
+        out_blocks, in_blocks = self.weight_scale.shape
+        block_size = self.block_size
+
+        blocks = self.weight.detach().view(out_blocks, block_size, in_blocks, block_size).to(dtype=dtype)
+        blocks.mul_(self.weight_scale.to(dtype=dtype)[:, None, :, None])
+        return blocks.view(out_blocks * block_size, in_blocks * block_size)[:self.out_features, :self.in_features]
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        super(LinearInt8BlockWise, self)._save_to_state_dict(destination, prefix, keep_vars)
+        destination[prefix + "weight"] = self.unquantized_weight(self.weight_scale.dtype)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        # state dicts contain the dequantized weight, it is quantized again instead of being copied into the weight
+        weight_key = prefix + "weight"
+        bias_key = prefix + "bias"
+        if weight_key in state_dict:
+            bias = state_dict.get(bias_key)
+            self.quantize(
+                state_dict[weight_key].to(device=self.weight.device, dtype=self.weight_scale.dtype),
+                bias.to(device=self.weight.device) if bias is not None else None,
+            )
+
+            state_dict = {key: value for key, value in state_dict.items() if key.startswith(prefix)}
+            state_dict[weight_key] = self.weight
+            if self.bias is not None and bias is not None:
+                state_dict[bias_key] = self.bias
+
+        super(LinearInt8BlockWise, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs
+        )
+
+    def forward(self, x: Tensor) -> Tensor:
+        weight = self.unquantized_weight(x.dtype)
+        bias = self.bias.to(dtype=x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
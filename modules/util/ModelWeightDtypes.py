@@ -18,6 +18,7 @@ class ModelWeightDtypes:
             decoder_vqgan: DataType,
             lora: DataType,
             embedding: DataType,
+            train_dtype: DataType | None = None,
     ):
         self.unet = unet
         self.prior = prior
@@ -31,6 +32,7 @@ class ModelWeightDtypes:
         self.decoder_vqgan = decoder_vqgan
         self.lora = lora
         self.embedding = embedding
+        self.train_dtype = train_dtype
 
     def all_dtypes(self) -> list:
         return [
@@ -50,5 +52,5 @@ class ModelWeightDtypes:
 
     @staticmethod
     def from_single_dtype(dtype:DataType):
-        params = [dtype for _ in set(inspect.signature(ModelWeightDtypes).parameters.keys())]
+        params = [dtype for name in inspect.signature(ModelWeightDtypes).parameters.keys() if name != "train_dtype"]
         return ModelWeightDtypes(*params)
@@ -569,6 +569,7 @@ class TrainConfig(BaseConfig):
             self.weight_dtype if self.decoder_vqgan.weight_dtype == DataType.NONE else self.decoder_vqgan.weight_dtype,
             self.weight_dtype if self.lora_weight_dtype == DataType.NONE else self.lora_weight_dtype,
             self.weight_dtype if self.embedding_weight_dtype == DataType.NONE else self.embedding_weight_dtype,
+            self.train_dtype,
         )
 
     def model_names(self) -> ModelNames:
@@ -6,11 +6,13 @@ import torch
 class DataType(Enum):
     NONE = 'NONE'
     FLOAT_8 = 'FLOAT_8'
+    SCALED_FLOAT_8 = 'SCALED_FLOAT_8'
     FLOAT_16 = 'FLOAT_16'
     FLOAT_32 = 'FLOAT_32'
     BFLOAT_16 = 'BFLOAT_16'
     TFLOAT_32 = 'TFLOAT_32'
     INT_8 = 'INT_8'
+    INT_8_BLOCK_WISE = 'INT_8_BLOCK_WISE'
     NFLOAT_4 = 'NFLOAT_4'
 
     def __str__(self):
@@ -26,6 +28,8 @@ class DataType(Enum):
         match self:
             case DataType.FLOAT_8:
                 return torch.float8_e4m3fn
+            case DataType.SCALED_FLOAT_8:
+                return torch.float8_e4m3fn
             case DataType.FLOAT_16:
                 return torch.float16
             case DataType.FLOAT_32:
@@ -42,11 +46,19 @@ class DataType(Enum):
 
     def is_quantized(self):
         return self in [DataType.FLOAT_8,
+                        DataType.SCALED_FLOAT_8,
                         DataType.INT_8,
+                        DataType.INT_8_BLOCK_WISE,
                         DataType.NFLOAT_4]
 
+    def quantize_fp8(self):
+        return self == DataType.SCALED_FLOAT_8
+
     def quantize_int8(self):
         return self == DataType.INT_8
 
+    def quantize_int8_block_wise(self):
+        return self == DataType.INT_8_BLOCK_WISE
+
     def quantize_nf4(self):
         return self == DataType.NFLOAT_4
@@ -0,0 +1,13 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes | str):
+    # orjson is a lot faster than the json module, but it's an optional dependency
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
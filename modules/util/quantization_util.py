@@ -1,5 +1,7 @@
 from typing import Callable
 
+from modules.module.quantized.LinearFp8 import LinearFp8
+from modules.module.quantized.LinearInt8BlockWise import LinearInt8BlockWise
 from modules.util.enum.DataType import DataType
 
 import torch
@@ -15,6 +17,13 @@ def __create_nf4_linear_layer(module: nn.Module):
         bias=module.bias is not None,
     )
 
+    # the weights are quantized when the layer is moved to a cuda device. Layers created before loading the
+    # weights (on the meta device) get their weights from the state dict instead
+    if not module.weight.is_meta:
+        quant_linear.weight.data = module.weight.data
+        if module.bias is not None:
+            quant_linear.bias.data = module.bias.data
+
     return quant_linear
 
 def __create_int8_linear_layer(module: nn.Module):
@@ -28,6 +37,13 @@ def __create_int8_linear_layer(module: nn.Module):
     return quant_linear
 
 
+def __create_fp8_linear_layer(module: nn.Module):
+    return LinearFp8.from_linear(module)
+
+def __create_int8_block_wise_linear_layer(module: nn.Module):
+    return LinearInt8BlockWise.from_linear(module)
+
+
 def replace_linear_layers(
         parent_module: nn.Module,
         convert_fn: Callable[[nn.Module], nn.Module],
@@ -100,6 +116,26 @@ def replace_linear_with_int8_layers(
         keep_in_fp32_modules=keep_in_fp32_modules,
     )
 
+def replace_linear_with_fp8_layers(
+        parent_module: nn.Module,
+        keep_in_fp32_modules: list[str] | None = None,
+):
+    replace_linear_layers(
+        parent_module=parent_module,
+        convert_fn=__create_fp8_linear_layer,
+        keep_in_fp32_modules=keep_in_fp32_modules,
+    )
+
+def replace_linear_with_int8_block_wise_layers(
+        parent_module: nn.Module,
+        keep_in_fp32_modules: list[str] | None = None,
+):
+    replace_linear_layers(
+        parent_module=parent_module,
+        convert_fn=__create_int8_block_wise_linear_layer,
+        keep_in_fp32_modules=keep_in_fp32_modules,
+    )
+
 def set_nf4_compute_type(module: nn.Module, dtype: DataType):
     for child_module in module.modules():
         if isinstance(child_module, bnb.nn.LinearNF4):
@@ -107,6 +143,9 @@ def set_nf4_compute_type(module: nn.Module, dtype: DataType):
             child_module.compute_type_is_set = True
 
 def get_unquantized_weight(module: nn.Module, dtype: torch.dtype) -> Tensor:
+    if isinstance(module, LinearFp8 | LinearInt8BlockWise):
+        return module.unquantized_weight(dtype)
+
     param = module.weight
 
     if isinstance(param, bnb.nn.Params4bit):
@@ -130,6 +169,9 @@ def get_unquantized_weight(module: nn.Module, dtype: torch.dtype) -> Tensor:
     return param.detach().to(dtype=dtype)
 
 def get_weight_shape(module: nn.Module) -> torch.Size:
+    if isinstance(module, LinearInt8BlockWise):
+        return torch.Size((module.out_features, module.in_features))
+
     param = module.weight
 
     if isinstance(param, bnb.nn.Params4bit):
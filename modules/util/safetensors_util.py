@@ -0,0 +1,27 @@
+import os
+from collections.abc import Iterable, Iterator
+
+from torch import Tensor
+
+from safetensors import safe_open
+
+
+def prefetch_file(file_name: str):
+    # asks the kernel to start reading the file in the background, so the data is already cached when it's needed.
+    # posix_fadvise is not available on Windows and macOS
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    fd = os.open(file_name, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def iter_tensors(file_name: str, keys: Iterable[str]) -> Iterator[Tensor]:
+    # keeps one handle open while the generator is consumed. The tensors are cloned, because views into the memory
+    # mapped file would keep it mapped as long as they are alive, which prevents deleting it on Windows
+    with safe_open(file_name, framework="pt") as f:
+        for key in keys:
+            yield f.get_tensor(key).clone()
@@ -1,4 +1,5 @@
 import gc
+import pickle
 
 import torch
 
@@ -27,3 +28,12 @@ def torch_gc():
 
     if torch.backends.mps.is_available():
         torch.mps.empty_cache()
+
+
+def safe_torch_load(path: str, device: torch.device | str = "cpu"):
+    try:
+        # mmap defers reading the tensor data until it's accessed, weights_only uses the restricted unpickler
+        return torch.load(path, map_location=device, mmap=True, weights_only=True)
+    except (TypeError, RuntimeError, pickle.UnpicklingError):
+        # older torch versions, files saved in the legacy format or files containing arbitrary objects
+        return torch.load(path, map_location=device)